@@ -1,16 +1,21 @@
 # app_basic_auth.py
+import hashlib
+import hmac
 import os
 import secrets
-from typing import List, Optional, Any, Dict
+from dataclasses import dataclass
+from typing import List, Optional, Any, Dict, Tuple
 from datetime import date, datetime
 from decimal import Decimal
 
-from fastapi import FastAPI, HTTPException, Depends, status
+import orjson
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
+from starlette.background import BackgroundTask
 from pydantic import BaseModel, validator
 from sqlalchemy import (
-    create_engine,
     MetaData,
     Table,
     Column,
@@ -19,11 +24,18 @@ from sqlalchemy import (
     Text,
     Date,
     Numeric,
+    bindparam,
     select,
     text,
 )
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import (
+    AsyncConnection,
+    AsyncEngine,
+    AsyncResult,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
 from sqlalchemy.exc import IntegrityError
 
 from dotenv import load_dotenv
@@ -33,19 +45,67 @@ load_dotenv()
 # ---------------------------
 # Config & DB
 # ---------------------------
-DB_HOST = os.getenv("PGHOST", "localhost")
-DB_PORT = os.getenv("PGPORT", "5432")
-DB_NAME = os.getenv("PGDATABASE", "your_db")
-DB_USER = os.getenv("PGUSER", "your_user")
-DB_PASSWORD = os.getenv("PGPASSWORD", "your_pass")
-
-DATABASE_URL = (
-    os.getenv("DATABASE_URL")
-    or f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-)
+@dataclass(frozen=True, slots=True)
+class Settings:
+    database_url: str
+    db_pool_size: int
+    db_max_overflow: int
+    db_pool_timeout: int
+    db_pool_recycle: int
+    api_user: bytes
+    api_pass: bytes
+    allowed_origins: Tuple[str, ...]
+    host: str
+    port: int
+    env: str
+    log_level: str
+
+
+def _database_url() -> str:
+    url = os.getenv("DATABASE_URL") or (
+        f"postgresql+asyncpg://{os.getenv('PGUSER', 'your_user')}"
+        f":{os.getenv('PGPASSWORD', 'your_pass')}"
+        f"@{os.getenv('PGHOST', 'localhost')}:{os.getenv('PGPORT', '5432')}"
+        f"/{os.getenv('PGDATABASE', 'your_db')}"
+    )
+    # accept sync-style URLs (e.g. an older .env) and run them through asyncpg
+    for prefix in ("postgresql+psycopg2://", "postgresql://", "postgres://"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg://" + url[len(prefix) :]
+    return url
+
+
+def load_settings() -> Settings:
+    # read the environment once; everything else uses the frozen SETTINGS
+    return Settings(
+        database_url=_database_url(),
+        # connection pool (per worker process)
+        db_pool_size=int(os.getenv("DB_POOL_SIZE", 20)),
+        db_max_overflow=int(os.getenv("DB_MAX_OVERFLOW", 10)),
+        db_pool_timeout=int(os.getenv("DB_POOL_TIMEOUT", 30)),
+        db_pool_recycle=int(os.getenv("DB_POOL_RECYCLE", 3600)),
+        # Basic Auth credentials, encoded once for the digest check
+        api_user=os.getenv("API_BASIC_USER", "admin").encode("utf-8"),
+        api_pass=os.getenv("API_BASIC_PASS", "password").encode("utf-8"),
+        allowed_origins=tuple(os.getenv("ALLOWED_ORIGINS", "*").split(",")),
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", 8000)),
+        env=os.getenv("ENV", "production"),
+        log_level=os.getenv("LOG_LEVEL", "info"),
+    )
 
-engine: Engine = create_engine(DATABASE_URL, pool_pre_ping=True)
-SessionLocal = sessionmaker(bind=engine)
+
+SETTINGS = load_settings()
+
+engine: AsyncEngine = create_async_engine(
+    SETTINGS.database_url,
+    pool_size=SETTINGS.db_pool_size,
+    max_overflow=SETTINGS.db_max_overflow,
+    pool_timeout=SETTINGS.db_pool_timeout,
+    pool_recycle=SETTINGS.db_pool_recycle,
+    pool_pre_ping=True,
+)
+SessionLocal = async_sessionmaker(engine, expire_on_commit=False)
 metadata = MetaData()
 
 trp_table = Table(
@@ -66,19 +126,46 @@ trp_table = Table(
     schema="public",
 )
 
+# by-id statements built once at import; callers pass {"item_id": ...}
+_TRP_SELECT_BY_ID = select(trp_table).where(trp_table.c.id == bindparam("item_id"))
+_TRP_ID_EXISTS = (
+    select(trp_table.c.id).where(trp_table.c.id == bindparam("item_id")).limit(1)
+)
+_TRP_UPDATE_BY_ID = (
+    trp_table.update()
+    .where(trp_table.c.id == bindparam("item_id"))
+    .returning(*trp_table.c)
+)
+_TRP_DELETE_BY_ID = (
+    trp_table.delete()
+    .where(trp_table.c.id == bindparam("item_id"))
+    .returning(trp_table.c.id)
+)
+
 # ---------------------------
 # Basic Auth setup
 # ---------------------------
 security = HTTPBasic()
 
-API_USER = os.getenv("API_BASIC_USER", "admin")
-API_PASS = os.getenv("API_BASIC_PASS", "password")
+# per-process key: digests only need to match within this process
+_CREDENTIAL_KEY = secrets.token_bytes(32)
+
+
+def _credential_digest(username: bytes, password: bytes) -> bytes:
+    # length-prefix the username so "a:b" + "c" and "a" + "b:c" differ
+    msg = b"%d:%s:%s" % (len(username), username, password)
+    return hmac.new(_CREDENTIAL_KEY, msg, hashlib.sha256).digest()
 
 
-def get_current_username(credentials: HTTPBasicCredentials = Depends(security)) -> str:
-    correct_user = secrets.compare_digest(credentials.username, API_USER)
-    correct_pass = secrets.compare_digest(credentials.password, API_PASS)
-    if not (correct_user and correct_pass):
+_EXPECTED_CREDENTIAL_DIGEST = _credential_digest(SETTINGS.api_user, SETTINGS.api_pass)
+
+
+async def get_current_username(credentials: HTTPBasicCredentials = Depends(security)) -> str:
+    # one constant-time compare of fixed-length digests covers both fields
+    got = _credential_digest(
+        credentials.username.encode("utf-8"), credentials.password.encode("utf-8")
+    )
+    if not hmac.compare_digest(got, _EXPECTED_CREDENTIAL_DIGEST):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid authentication credentials",
@@ -136,54 +223,61 @@ class TRPOut(TRPBase):
 # ---------------------------
 # FastAPI app
 # ---------------------------
-app = FastAPI(title="TRP API (BasicAuth)", version="1.0")
+def _orjson_default(obj: Any) -> Any:
+    # orjson handles date/datetime natively; Numeric columns come back as Decimal
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError
+
+
+class TRPJSONResponse(ORJSONResponse):
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(
+            content,
+            default=_orjson_default,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY,
+        )
+
+
+app = FastAPI(
+    title="TRP API (BasicAuth)",
+    version="1.0",
+    default_response_class=TRPJSONResponse,
+)
 
 # Production-ready CORS configuration
-allowed_origins = os.getenv("ALLOWED_ORIGINS", "*").split(",")
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=allowed_origins,
+    allow_origins=list(SETTINGS.allowed_origins),
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE"],
     allow_headers=["*"],
 )
 
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
-# robust row -> dict converter (date -> iso string, Decimal -> float)
+# row -> dict; date/Decimal values are left for TRPJSONResponse to encode
 def row_to_dict(row) -> Dict[str, Any]:
-    # support Row mapping or row proxy
-    try:
-        mapping = row._mapping  # SQLAlchemy Row in 1.4+
-    except Exception:
-        try:
-            mapping = dict(row)
-        except Exception:
-            mapping = {}
-
-    out: Dict[str, Any] = {}
-    for k, v in mapping.items():
-        if isinstance(v, (datetime, date)):
-            out[k] = v.isoformat()
-        elif isinstance(v, Decimal):
-            # Convert Decimal safely to float (or str if precision important)
-            out[k] = float(v)
-        else:
-            out[k] = v
-    return out
+    return dict(row._mapping)
+
+
+# If-None-Match uses weak comparison: ignore W/ prefixes on both sides
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+    return etag.removeprefix("W/") in tags
 
 
 # helper to fetch a single TRP row by id (no FastAPI deps — pure function)
-def fetch_trp_by_id(db_session, item_id: int):
-    stmt = select(trp_table).where(trp_table.c.id == item_id)
-    r = db_session.execute(stmt).first()
+async def fetch_trp_by_id(db_session: AsyncSession, item_id: int):
+    r = (await db_session.execute(_TRP_SELECT_BY_ID, {"item_id": item_id})).first()
     if not r:
         return None
     return row_to_dict(r)
@@ -193,29 +287,82 @@ def fetch_trp_by_id(db_session, item_id: int):
 # Routes (all protected by Basic Auth)
 # ---------------------------
 # Protect all routes by adding dependency param _user=Depends(...) where needed
+# Postgres renders each row as JSON; cast to text so the driver hands the
+# document back as-is instead of decoding it into Python objects. Only the
+# list-view columns are selected, ordered by id, so the covering index from
+# migrations/001_trp_list_covering_index.sql can serve it index-only.
+_TRP_LIST_JSON = text(
+    "SELECT row_to_json(t)::text FROM ("
+    "SELECT id, outlet, date, category, quantity, total_sales, profit "
+    'FROM public."TRP" ORDER BY id LIMIT :lim'
+    ") t"
+)
+TRP_LIST_CHUNK_SIZE = 1000
+
+
+async def _stream_trp_list(conn: AsyncConnection, result: AsyncResult):
+    # server-side cursor: only one chunk of rows is held in memory at a time
+    try:
+        yield b"["
+        sep = b""
+        async for chunk in result.scalars().partitions():
+            yield sep + ",".join(chunk).encode("utf-8")
+            sep = b","
+        yield b"]"
+    finally:
+        await result.close()
+        await conn.close()
+
+
 @app.get("/trp")
-def list_trp(limit: int = 100, _user: str = Depends(get_current_username)):
-    # use a simple connection to run the select
-    with engine.connect() as conn:
-        result = conn.execute(
-            text('SELECT * FROM public."TRP" LIMIT :lim'), {"lim": limit}
+async def list_trp(
+    limit: int = Query(100, ge=0), _user: str = Depends(get_current_username)
+):
+    # connect and execute before the 200 is sent so DB errors still surface as 500
+    conn = await engine.connect()
+    try:
+        result = await conn.stream(
+            _TRP_LIST_JSON,
+            {"lim": limit},
+            execution_options={"yield_per": TRP_LIST_CHUNK_SIZE},
         )
-        rows = result.fetchall()
-        return [row_to_dict(r) for r in rows]
+    except BaseException:
+        await conn.close()
+        raise
+    # the background close covers a client that disconnects before the body
+    # generator starts; closing an already-closed connection is a no-op
+    return StreamingResponse(
+        _stream_trp_list(conn, result),
+        media_type="application/json",
+        background=BackgroundTask(conn.close),
+    )
 
 
-@app.get("/trp/{item_id}", response_model=TRPOut)
-def get_trp(
-    item_id: int, db=Depends(get_db), _user: str = Depends(get_current_username)
+# Rows returned by the routes below come straight from the DB, so they skip
+# re-validation against TRPOut; the model is still advertised in OpenAPI.
+@app.get("/trp/{item_id}", response_model=None, responses={200: {"model": TRPOut}})
+async def get_trp(
+    item_id: int,
+    request: Request,
+    db=Depends(get_db),
+    _user: str = Depends(get_current_username),
 ):
-    row = fetch_trp_by_id(db, item_id)
+    row = await fetch_trp_by_id(db, item_id)
     if not row:
         raise HTTPException(status_code=404, detail="Record not found")
-    return row
+    response = TRPJSONResponse(row)
+    # ETag derives from the body, so PUT/DELETE invalidate it in every worker
+    etag = 'W/"%s"' % hashlib.blake2b(response.body, digest_size=8).hexdigest()
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return response
 
 
-@app.post("/trp", response_model=TRPOut, status_code=201)
-def create_trp(
+@app.post(
+    "/trp", response_model=None, status_code=201, responses={201: {"model": TRPOut}}
+)
+async def create_trp(
     payload: TRPCreate, db=Depends(get_db), _user: str = Depends(get_current_username)
 ):
     ins = trp_table.insert().values(
@@ -232,57 +379,61 @@ def create_trp(
         profit=payload.profit,
     )
     try:
-        res = db.execute(ins)
-        db.commit()
+        res = await db.execute(ins)
+        await db.commit()
     except IntegrityError as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=400, detail=str(e))
     new_id = res.inserted_primary_key[0]
-    row = fetch_trp_by_id(db, new_id)
+    row = await fetch_trp_by_id(db, new_id)
     if not row:
         raise HTTPException(status_code=500, detail="Failed to fetch created record")
-    return row
+    return TRPJSONResponse(row, status_code=201)
 
 
-@app.put("/trp/{item_id}", response_model=TRPOut)
-def update_trp(
+@app.put("/trp/{item_id}", response_model=None, responses={200: {"model": TRPOut}})
+async def update_trp(
     item_id: int,
     payload: TRPUpdate,
     db=Depends(get_db),
     _user: str = Depends(get_current_username),
 ):
-    stmt = select(trp_table).where(trp_table.c.id == item_id)
-    existing = db.execute(stmt).first()
-    if not existing:
-        raise HTTPException(status_code=404, detail="Record not found")
-    update_values = {k: v for k, v in payload.dict().items() if v is not None}
+    # only fields the client sent; an explicit null clears the column
+    update_values = payload.model_dump(exclude_unset=True)
     if not update_values:
+        # keep 404 ahead of 400; only the id is needed to tell them apart
+        if (await db.execute(_TRP_ID_EXISTS, {"item_id": item_id})).scalar() is None:
+            raise HTTPException(status_code=404, detail="Record not found")
         raise HTTPException(status_code=400, detail="No fields to update")
-    upd = trp_table.update().where(trp_table.c.id == item_id).values(**update_values)
-    db.execute(upd)
-    db.commit()
-    row = fetch_trp_by_id(db, item_id)
-    return row
+    # single round-trip: UPDATE ... RETURNING doubles as the existence check
+    upd = _TRP_UPDATE_BY_ID.values(**update_values)
+    try:
+        updated = (await db.execute(upd, {"item_id": item_id})).first()
+        if not updated:
+            raise HTTPException(status_code=404, detail="Record not found")
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+    return TRPJSONResponse(row_to_dict(updated))
 
 
 @app.delete("/trp/{item_id}", status_code=204)
-def delete_trp(
+async def delete_trp(
     item_id: int, db=Depends(get_db), _user: str = Depends(get_current_username)
 ):
-    stmt = select(trp_table).where(trp_table.c.id == item_id)
-    existing = db.execute(stmt).first()
-    if not existing:
+    deleted = (await db.execute(_TRP_DELETE_BY_ID, {"item_id": item_id})).scalar()
+    if deleted is None:
         raise HTTPException(status_code=404, detail="Record not found")
-    db.execute(trp_table.delete().where(trp_table.c.id == item_id))
-    db.commit()
+    await db.commit()
     return None
 
 
 @app.get("/health")
-def health(db=Depends(get_db), _user: str = Depends(get_current_username)):
+async def health(db=Depends(get_db), _user: str = Depends(get_current_username)):
     try:
-        with engine.connect() as conn:
-            conn.execute(select(trp_table.c.id).limit(1))
+        async with engine.connect() as conn:
+            await conn.execute(select(trp_table.c.id).limit(1))
         return {"status": "ok"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -290,11 +441,11 @@ def health(db=Depends(get_db), _user: str = Depends(get_current_username)):
 
 # Unauthenticated health check for load balancers
 @app.get("/health-check")
-def health_check_no_auth():
+async def health_check_no_auth():
     """Simple health check without authentication for load balancers/monitoring"""
     try:
-        with engine.connect() as conn:
-            conn.execute(text("SELECT 1"))
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
         return {"status": "healthy", "service": "trp-api"}
     except Exception as e:
         return {"status": "unhealthy", "error": str(e)}, 503
@@ -305,8 +456,10 @@ if __name__ == "__main__":
 
     uvicorn.run(
         "app_basic_auth:app",
-        host=os.getenv("HOST", "0.0.0.0"),
-        port=int(os.getenv("PORT", 8000)),
-        reload=os.getenv("ENV", "production") != "production",
-        log_level=os.getenv("LOG_LEVEL", "info"),
+        host=SETTINGS.host,
+        port=SETTINGS.port,
+        loop="uvloop",
+        http="httptools",
+        reload=SETTINGS.env != "production",
+        log_level=SETTINGS.log_level,
     )
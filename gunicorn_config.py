@@ -0,0 +1,42 @@
+# gunicorn_config.py
+# Usage: gunicorn -c gunicorn_config.py app_basic_auth:app
+import multiprocessing
+import os
+
+from dotenv import load_dotenv
+from uvicorn.workers import UvicornWorker
+
+load_dotenv()
+
+
+class UvloopHttptoolsWorker(UvicornWorker):
+    # pin the C event loop and HTTP parser instead of uvicorn's "auto" fallback
+    CONFIG_KWARGS = {"loop": "uvloop", "http": "httptools"}
+
+
+# ---------------------------
+# Server socket & workers
+# ---------------------------
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WORKERS", multiprocessing.cpu_count() * 2 + 1))
+worker_class = "gunicorn_config.UvloopHttptoolsWorker"
+timeout = int(os.getenv("TIMEOUT", 120))
+keepalive = int(os.getenv("KEEPALIVE", 5))
+
+# ---------------------------
+# Logging
+# ---------------------------
+loglevel = os.getenv("LOG_LEVEL", "info")
+accesslog = "-"
+errorlog = "-"
+
+# Import the app once in the master so workers share its pages copy-on-write
+preload_app = True
+
+
+def post_fork(server, worker):
+    # The preloaded engine's pool was created in the master; give each worker
+    # a fresh pool so no DB socket is ever shared across processes.
+    from app_basic_auth import engine
+
+    engine.sync_engine.dispose(close=False)
@@ -0,0 +1,8 @@
+-- Covering index for GET /trp: lets
+--   SELECT id, outlet, date, category, quantity, total_sales, profit
+--   FROM public."TRP" ORDER BY id LIMIT n
+-- run as an index-only scan without touching the heap.
+-- CONCURRENTLY avoids blocking writes; run it outside a transaction block.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS trp_out_idx
+    ON public."TRP" (id)
+    INCLUDE (outlet, date, category, quantity, total_sales, profit);